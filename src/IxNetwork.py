@@ -4,6 +4,8 @@ import sys
 import time
 import select
 import getpass
+import struct
+import threading
 
 try:
     unicode = unicode
@@ -15,6 +17,26 @@ class IxNetError(Exception):
     """Default IxNet error"""
 
 
+# each recorded chunk is stored as direction, seconds since the recording
+# started and content length followed by the raw content, a connection
+# record marks the start of every new application session
+RECORD_HEADER = '<cdI'
+RECORD_CONNECT = b'C'
+RECORD_SEND = b'S'
+RECORD_RECV = b'R'
+
+
+class _IxNetCallOptions(threading.local):
+    # options set ahead of a call only apply to the calling thread, so
+    # threads sharing a session cannot pick up each other's flags or
+    # buffered commands
+    def __init__(self):
+        self.buffer = False
+        self.sendBuffer = list()
+        self.isAsync = False
+        self.timeout = None
+
+
 class IxNet:
     def __init__(self):
         self._root = str('::ixNet::OBJ-/')
@@ -28,15 +50,22 @@ class IxNet:
         self._addContentSeparator = 0
         self._firstItem = True
         self._sendContent = list()
-        self._buffer = False
-        self._sendBuffer = list()
+        self._call = _IxNetCallOptions()
         self._decoratedResult = list()
         self._filename = None
         self._debug = False
-        self._async = False
-        self._timeout = None
         self._OK = '::ixNet::OK'
         self._version = '8.10.1046.6'
+        self._recordFile = None
+        self._recordStart = None
+        self._recordDirection = None
+        self._recordTime = None
+        self._recordChunks = list()
+        self._recordHeld = None
+        self._recordPreamble = None
+        self._connectPreamble = list()
+        self._lock = threading.RLock()
+        self._deadline = None
 
     def setDebug(self, debug):
         self._debug = debug
@@ -49,11 +78,29 @@ class IxNet:
         return self._null
 
     def setAsync(self):
-        self._async = True;
+        self._call.isAsync = True
         return self
 
     def setTimeout(self, timeout):
-        self._timeout = timeout
+        self._call.timeout = timeout
+        return self
+
+    def setRecord(self, filename):
+        # record the framed wire traffic to filename for later replay, the
+        # recording stops and the file is closed when the connection closes
+        # or when None is passed, a recording started on a connected session
+        # opens with the traffic of its connect so that it replays from the
+        # handshake like any other
+        if self._recordFile is not None:
+            self.__FlushRecord()
+            self._recordFile.close()
+            self._recordFile = None
+        if filename is not None:
+            self._recordFile = open(filename, 'wb')
+            self._recordStart = time.time()
+            if self._socket is not None:
+                for direction, content in self._connectPreamble:
+                    self.__Record(direction, content)
         return self
 
     def __initialConnect(self, address, port, options):
@@ -84,14 +131,22 @@ class IxNet:
         self._socket.setblocking(1)
 
         # process the results from the endpoint
+        # the handshake is held back so that a proxy hop is left out of any recording
+        self._recordHeld = list()
         connectString = self.__Recv()
+        handshake = b''.join(self._recordHeld)
         if connectString == 'proxy':
             self._socket.sendall(options)
             self._connectTokens = str(self.__Recv())
+            self._recordHeld = None
             connectTokens = dict(zip(self._connectTokens.split()[::2], self._connectTokens.split()[1::2]))
             self._proxySocket = self._socket
             self._socket = None
             self.__initialConnect(address, int(connectTokens['-port']), '')
+        else:
+            self._recordHeld = None
+            self.__Record(RECORD_CONNECT, b'')
+            self.__Record(RECORD_RECV, handshake)
 
     def connect(self, address, *args):
         try:
@@ -124,9 +179,15 @@ class IxNet:
                 options += ' -closeServerOnDisconnect true'
 
             if self._socket is None:
-                self.__initialConnect(address, int(nameValuePairs['-port']), options)
-                conRes = self.__SendRecv('ixNet', 'connect', address, '-clientType', 'python', *args)
-                self._CheckClientVersion()
+                # the connect traffic is kept for recordings started later on
+                self._recordPreamble = list()
+                try:
+                    self.__initialConnect(address, int(nameValuePairs['-port']), options)
+                    conRes = self.__SendRecv('ixNet', 'connect', address, '-clientType', 'python', *args)
+                    self._CheckClientVersion()
+                finally:
+                    self._connectPreamble = self._recordPreamble
+                    self._recordPreamble = None
                 return conRes
 
             else:
@@ -140,9 +201,17 @@ class IxNet:
                              + str(address) + " port:" + str(nameValuePairs['-port'])
                              + ". Error:" + str(e))
 
-    def disconnect(self):
-        response = self.__SendRecv('ixNet', 'disconnect')
-        self.__Close()
+    def disconnect(self, timeout=None):
+        # a timeout (in seconds) bounds the whole exchange with the server,
+        # the connection is closed locally either way
+        with self._lock:
+            if timeout is not None:
+                self._deadline = time.time() + timeout
+            try:
+                response = self.__SendRecv('ixNet', 'disconnect')
+            finally:
+                self._deadline = None
+                self.__Close()
         return response
 
     def help(self, *args):
@@ -154,6 +223,9 @@ class IxNet:
         else:
             raise IxNetError("setSessionParameter requires an even number of name/value pairs");
 
+    def isConnected(self):
+        return self._socket is not None
+
     def getVersion(self):
         if self._socket is None:
             return self._version
@@ -181,12 +253,20 @@ class IxNet:
     def remove(self, objRef):
         return self.__SendRecv('ixNet', 'remove', objRef)
 
+    def removeList(self, objRefs):
+        # buffered like setAttribute, the removes go out with the next
+        # unbuffered call such as commit in a single request
+        for objRef in objRefs:
+            self._call.buffer = True
+            self.__SendRecv('ixNet', 'remove', self.__CheckObjRef(objRef))
+        return self._OK
+
     def setAttribute(self, objRef, name, value):
-        self._buffer = True
+        self._call.buffer = True
         return self.__SendRecv('ixNet', 'setAttribute', self.__CheckObjRef(objRef), name, value)
 
     def setMultiAttribute(self, objRef, *args):
-        self._buffer = True
+        self._call.buffer = True
         return self.__SendRecv('ixNet', 'setMultiAttribute', self.__CheckObjRef(objRef), *args)
 
     def getAttribute(self, objRef, name):
@@ -198,6 +278,29 @@ class IxNet:
     def getFilteredList(self, objRef, child, name, value):
         return self.__SendRecv('ixNet', 'getFilteredList', self.__CheckObjRef(objRef), child, name, value)
 
+    def iterFilteredList(self, objRef, child, *args):
+        # the first name/value pair is filtered on the server when called so
+        # only matching refs are transferred, every further pair is checked
+        # lazily with one getAttribute round trip per candidate ref, so put
+        # the most selective pair first
+        if len(args) == 0 or len(args) % 2 != 0:
+            raise IxNetError("iterFilteredList requires at least one name/value pair")
+        filters = list(zip(args[::2], args[1::2]))
+        objRefs = self.getFilteredList(objRef, child, filters[0][0], filters[0][1])
+        if type(objRefs) in (str, unicode):
+            objRefs = [objRefs] if len(objRefs) > 0 and objRefs != self._null else []
+        return self.__IterFiltered(objRefs, filters[1:])
+
+    def getFilteredObject(self, objRef, child, *args):
+        for filteredRef in self.iterFilteredList(objRef, child, *args):
+            return filteredRef
+        return self._null
+
+    def __IterFiltered(self, objRefs, filters):
+        for objRef in objRefs:
+            if all(str(self.getAttribute(objRef, name)) == str(value) for name, value in filters):
+                yield objRef
+
     def adjustIndexes(self, objRef, object):
         return self.__SendRecv('ixNet', 'adjustIndexes', self.__CheckObjRef(objRef), object)
 
@@ -257,6 +360,7 @@ class IxNet:
                                '-ixNetRelative', '-overwrite')
 
     def __Close(self):
+        self.setRecord(None)
         try:
             if self._socket:
                 self._socket.close()
@@ -309,6 +413,18 @@ class IxNet:
         return
 
     def __SendRecv(self, *args):
+        # a session may be shared between threads, keep each request and its response together
+        with self._lock:
+            try:
+                return self.__SendRecvLocked(*args)
+            finally:
+                # per call options never outlive the call, even when it fails
+                self._call.isAsync = False
+                self._call.timeout = None
+                self._call.buffer = False
+                self._sendContent = list()
+
+    def __SendRecvLocked(self, *args):
         if self._socket is None:
             raise IxNetError('not connected')
 
@@ -317,32 +433,32 @@ class IxNet:
 
         argList = list(args)
 
-        if self._async:
+        if self._call.isAsync:
             argList.insert(1, '-async')
 
-        if self._timeout != None:
+        if self._call.timeout != None:
             argList.insert(1, '-timeout')
-            argList.insert(2, self._timeout)
+            argList.insert(2, self._call.timeout)
 
         for item in argList:
             self.__Join(item)
 
         self._sendContent.append('\03')
-        self._sendBuffer.append("".join(self._sendContent));
-        if self._buffer == False:
-            buffer = "".join(self._sendBuffer)
+        self._call.sendBuffer.append("".join(self._sendContent));
+        if self._call.buffer == False:
+            buffer = "".join(self._call.sendBuffer)
             if self._debug:
                 print("Sending: ", buffer)
             self.__Send("<001><002><009{0}>{1}".format(len(buffer),
                                                        buffer))
-            self._sendBuffer = list()
+            self._call.sendBuffer = list()
 
-        self._async = False
-        self._timeout = None
-        self._buffer = False
+        self._call.isAsync = False
+        self._call.timeout = None
+        self._call.buffer = False
         self._sendContent = list()
 
-        if len(self._sendBuffer) > 0:
+        if len(self._call.sendBuffer) > 0:
             return self._OK
         else:
             return self.__Recv()
@@ -354,7 +470,9 @@ class IxNet:
             try:
                 if type(content) is str:
                     content = content.encode('ascii')
+                self.__ApplyDeadline()
                 self._socket.sendall(content)
+                self.__Record(RECORD_SEND, content)
             except (socket.error,):
                 e = sys.exc_info()[1]
                 self.__Close()
@@ -366,11 +484,51 @@ class IxNet:
         else:
             try:
                 self._socket.sendall(content)
+                self.__Record(RECORD_SEND, content)
             except (socket.error,):
                 e = sys.exc_info()[1]
                 self.__Close()
                 raise IxNetError("Error:" + str(e))
 
+    def __ApplyDeadline(self):
+        if self._deadline is not None:
+            remaining = self._deadline - time.time()
+            if remaining <= 0:
+                raise socket.timeout('timed out')
+            self._socket.settimeout(remaining)
+
+    def __RecvBytes(self, size):
+        self.__ApplyDeadline()
+        content = self._socket.recv(size)
+        if len(content) == 0 and size > 0:
+            raise socket.error('Connection closed by the remote endpoint')
+        self.__Record(RECORD_RECV, content)
+        return content
+
+    def __Record(self, direction, content):
+        if self._recordHeld is not None:
+            self._recordHeld.append(content)
+            return
+        if self._recordPreamble is not None:
+            self._recordPreamble.append((direction, content))
+        if self._recordFile is None:
+            return
+        # consecutive chunks in the same direction are coalesced into one record
+        if direction != self._recordDirection or direction == RECORD_CONNECT:
+            self.__FlushRecord()
+            self._recordDirection = direction
+            self._recordTime = time.time() - self._recordStart
+        self._recordChunks.append(content)
+
+    def __FlushRecord(self):
+        if self._recordDirection is not None:
+            content = b''.join(self._recordChunks)
+            self._recordFile.write(struct.pack(RECORD_HEADER, self._recordDirection, self._recordTime, len(content)))
+            self._recordFile.write(content)
+        self._recordDirection = None
+        self._recordTime = None
+        self._recordChunks = list()
+
     def __Recv(self):
         self._decoratedResult = list()
         responseBuffer = str()
@@ -381,7 +539,7 @@ class IxNet:
                 contentLength = int(0)
 
                 while True:
-                    responseBuffer += self._socket.recv(1).decode('ascii')
+                    responseBuffer += self.__RecvBytes(1).decode('ascii')
                     startIndex = int(responseBuffer.find('<'))
                     stopIndex = int(responseBuffer.find('>'))
                     if startIndex != -1 and stopIndex != -1:
@@ -394,13 +552,13 @@ class IxNet:
 
                 if commandId == 1:
                     self._evalResult = self._evalError
-                    self._socket.recv(contentLength)
+                    self.__RecvBytes(contentLength)
                 elif commandId == 3:
-                    self._socket.recv(contentLength)
+                    self.__RecvBytes(contentLength)
                 elif commandId == 4:
-                    self._evalResult = self._socket.recv(contentLength).decode('ascii')
+                    self._evalResult = self.__RecvBytes(contentLength).decode('ascii')
                 elif commandId == 7:
-                    self._filename = self._socket.recv(contentLength).decode('ascii')
+                    self._filename = self.__RecvBytes(contentLength).decode('ascii')
                 elif commandId == 8:
                     binaryFile = open(self._filename, 'w+b')
                     chunk = bytearray()
@@ -408,7 +566,7 @@ class IxNet:
                     while contentLength > 0:
                         if contentLength < bytesToRead:
                             bytesToRead = contentLength
-                        chunk = self._socket.recv(bytesToRead)
+                        chunk = self.__RecvBytes(bytesToRead)
                         binaryFile.write(chunk)
                         contentLength -= len(chunk)
                     binaryFile.close()
@@ -419,7 +577,7 @@ class IxNet:
                     while contentLength > 0:
                         if contentLength < bytesToRead:
                             bytesToRead = contentLength
-                        chunk = self._socket.recv(bytesToRead).decode('ascii')
+                        chunk = self.__RecvBytes(bytesToRead).decode('ascii')
                         self._decoratedResult.append(chunk)
                         contentLength -= len(chunk)
                     break
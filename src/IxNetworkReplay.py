@@ -0,0 +1,214 @@
+import socket
+import struct
+import sys
+import threading
+import time
+
+from IxNetwork import IxNetError, RECORD_HEADER, RECORD_CONNECT, RECORD_SEND, RECORD_RECV
+
+
+def readRecording(filename):
+    # split a recording made with IxNet.setRecord into one list of
+    # (direction, timestamp, content) records per application session
+    sessions = list()
+    headerSize = struct.calcsize(RECORD_HEADER)
+    fid = open(filename, 'rb')
+    try:
+        while True:
+            header = fid.read(headerSize)
+            if len(header) == 0:
+                break
+            if len(header) != headerSize:
+                raise IxNetError('Truncated record header in ' + filename)
+            direction, timestamp, contentLength = struct.unpack(RECORD_HEADER, header)
+            content = fid.read(contentLength)
+            if len(content) != contentLength:
+                raise IxNetError('Truncated record content in ' + filename)
+            if direction == RECORD_CONNECT:
+                sessions.append(list())
+            elif len(sessions) > 0:
+                sessions[-1].append((direction, timestamp, content))
+    finally:
+        fid.close()
+
+    return sessions
+
+
+def splitMessages(content):
+    # split a chunk of sent bytes into client requests, every request
+    # ends with a <009> tag followed by its content
+    messages = list()
+    startIndex = 0
+    index = 0
+    while True:
+        tagIndex = content.find(b'<', index)
+        if tagIndex == -1:
+            break
+        stopIndex = content.find(b'>', tagIndex)
+        commandId = int(content[tagIndex + 1:tagIndex + 4])
+        contentLength = 0
+        if tagIndex + 4 < stopIndex:
+            contentLength = int(content[tagIndex + 4:stopIndex])
+        index = stopIndex + 1
+        if commandId == 7:
+            index += contentLength
+        elif commandId == 9:
+            index += contentLength
+            messages.append(content[startIndex:index])
+            startIndex = index
+
+    return messages
+
+
+def splitExchanges(session):
+    # turn the records of one session into the handshake sent on accept and
+    # a list of (request, responses) exchanges, each response is kept with
+    # its delay after the request was sent
+    handshake = list()
+    exchanges = list()
+    requestTime = None
+    for direction, timestamp, content in session:
+        if direction == RECORD_SEND:
+            for message in splitMessages(content):
+                exchanges.append((message, list()))
+            requestTime = timestamp
+        elif direction == RECORD_RECV:
+            if len(exchanges) == 0:
+                handshake.append(content)
+            else:
+                exchanges[-1][1].append((timestamp - requestTime, content))
+
+    return b''.join(handshake), exchanges
+
+
+class IxNetReplayServer:
+    def __init__(self, filename, address='127.0.0.1', port=0, timeScale=1.0, recvTimeout=30, resyncWindow=16):
+        # a timeScale of 1.0 keeps the original response timing, 0 replays
+        # as fast as the client can read
+        # a request that does not match the next recorded one is looked up in
+        # the following resyncWindow requests, so dropped requests are skipped,
+        # otherwise it is answered with the next recorded response in order
+        self._sessions = [splitExchanges(session) for session in readRecording(filename)]
+        self._address = address
+        self._port = port
+        self._timeScale = timeScale
+        self._recvTimeout = recvTimeout
+        self._resyncWindow = resyncWindow
+        self._socket = None
+        self._thread = None
+        self._mismatches = list()
+        self._errors = list()
+
+    def getPort(self):
+        return self._port
+
+    def getMismatches(self):
+        # (session, request, expected, received) for every request that did
+        # not match the recording, received is None for a skipped request
+        return self._mismatches
+
+    def getErrors(self):
+        return self._errors
+
+    def start(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self._address, self._port))
+        self._socket.listen(1)
+        self._port = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self.__Serve)
+        self._thread.daemon = True
+        self._thread.start()
+        return self._port
+
+    def stop(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def __Serve(self):
+        for sessionIndex, session in enumerate(self._sessions):
+            clientSocket = None
+            try:
+                clientSocket, clientAddress = self._socket.accept()
+                clientSocket.settimeout(self._recvTimeout)
+                self.__Replay(clientSocket, sessionIndex, session)
+            except (socket.error, IxNetError):
+                self._errors.append("Session %s: %s" % (sessionIndex, sys.exc_info()[1]))
+            finally:
+                if clientSocket is not None:
+                    clientSocket.close()
+
+    def __Replay(self, clientSocket, sessionIndex, session):
+        handshake, exchanges = session
+        clientSocket.sendall(handshake)
+
+        index = 0
+        while True:
+            try:
+                request = self.__RecvMessage(clientSocket)
+            except socket.timeout:
+                self._errors.append("Session %s: timed out waiting for request %s" % (sessionIndex, index))
+                return
+            if request is None:
+                break
+
+            match = self.__FindRequest(exchanges, index, request)
+            if match is None:
+                if index >= len(exchanges):
+                    self._errors.append("Session %s: unexpected request %r past the end of the recording" %
+                                        (sessionIndex, request))
+                    return
+                self._mismatches.append((sessionIndex, index, exchanges[index][0], request))
+                match = index
+            for skipped in range(index, match):
+                self._mismatches.append((sessionIndex, skipped, exchanges[skipped][0], None))
+            index = match + 1
+
+            requestTime = time.time()
+            for delay, content in exchanges[match][1]:
+                delay = delay * self._timeScale - (time.time() - requestTime)
+                if delay > 0:
+                    time.sleep(delay)
+                clientSocket.sendall(content)
+
+        for skipped in range(index, len(exchanges)):
+            self._mismatches.append((sessionIndex, skipped, exchanges[skipped][0], None))
+
+    def __FindRequest(self, exchanges, index, request):
+        for candidate in range(index, min(index + self._resyncWindow, len(exchanges))):
+            if exchanges[candidate][0] == request:
+                return candidate
+        return None
+
+    def __RecvMessage(self, clientSocket):
+        # returns None when the client closes the connection between requests
+        message = list()
+        while True:
+            tag = self.__RecvExact(clientSocket, 1, len(message) == 0)
+            if tag is None:
+                return None
+            while not tag.endswith(b'>'):
+                tag += self.__RecvExact(clientSocket, 1)
+            message.append(tag)
+            commandId = int(tag[1:4])
+            contentLength = int(tag[4:-1]) if len(tag) > 5 else 0
+            if commandId in (7, 9):
+                message.append(self.__RecvExact(clientSocket, contentLength))
+            if commandId == 9:
+                return b''.join(message)
+
+    def __RecvExact(self, clientSocket, size, closeAllowed=False):
+        chunks = list()
+        while size > 0:
+            chunk = clientSocket.recv(size)
+            if len(chunk) == 0:
+                if closeAllowed and len(chunks) == 0:
+                    return None
+                raise IxNetError('Client closed the connection during a request')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
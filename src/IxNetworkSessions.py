@@ -0,0 +1,152 @@
+import os
+import sys
+import threading
+import time
+
+from IxNetwork import IxNet, IxNetError
+
+
+class _IxNetSessionEntry:
+    def __init__(self):
+        self.session = None
+        self.error = None
+        self.refCount = 0
+        self.lastUsed = time.time()
+        self.ready = threading.Event()
+
+
+class IxNetSessionRegistry:
+    def __init__(self, idleTimeout=300, disconnectTimeout=30, recordDirectory=None):
+        # sessions without references are disconnected once idle for
+        # idleTimeout seconds by a timer started on their last release,
+        # with recordDirectory, or IXNET_RECORD_DIR set when a session
+        # connects, every session is recorded to a file of its own there
+        self._idleTimeout = idleTimeout
+        self._disconnectTimeout = disconnectTimeout
+        self._recordDirectory = recordDirectory
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def acquire(self, address, port, version):
+        # return a connected session for (address, port, version), only the
+        # first caller connects while concurrent callers wait on its handshake
+        key = (str(address), str(port), str(version))
+        with self._lock:
+            idleSessions = self.__PopIdle()
+            entry = self._entries.get(key)
+            # a session closed by a socket error is replaced rather than handed out again
+            if entry is not None and entry.session is not None and not entry.session.isConnected():
+                entry = None
+            owner = entry is None
+            if owner:
+                entry = _IxNetSessionEntry()
+                self._entries[key] = entry
+            entry.refCount += 1
+        self.__Disconnect(idleSessions)
+
+        if owner:
+            try:
+                session = IxNet()
+                recordDirectory = self._recordDirectory or os.environ.get('IXNET_RECORD_DIR')
+                if recordDirectory:
+                    session.setRecord(os.path.join(recordDirectory, 'ixnet_%s_%s_%d.rec' % (
+                        address, port, int(time.time() * 1000))))
+                session.connect(address, '-port', port, '-version', version)
+            except Exception:
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                entry.error = sys.exc_info()[1]
+                entry.ready.set()
+                raise
+            entry.session = session
+            entry.ready.set()
+        else:
+            entry.ready.wait()
+            if entry.error is not None:
+                raise IxNetError("Shared connection to %s:%s failed, %s" % (address, port, entry.error))
+
+        return entry.session
+
+    def release(self, session, closeUnused=False, timeout=None):
+        # drop one reference, with closeUnused the last holder disconnects the
+        # session right away instead of leaving it to the idle timer
+        unusedSession = None
+        startTimer = False
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.session is session and entry.refCount > 0:
+                    entry.refCount -= 1
+                    entry.lastUsed = time.time()
+                    if entry.refCount == 0:
+                        if closeUnused:
+                            unusedSession = entry.session
+                            del self._entries[key]
+                        else:
+                            startTimer = True
+                    break
+            idleSessions = self.__PopIdle()
+        self.__Disconnect(idleSessions)
+
+        if startTimer:
+            self.__ScheduleReap(self._idleTimeout)
+        if unusedSession is not None:
+            unusedSession.disconnect(self._disconnectTimeout if timeout is None else timeout)
+
+        return unusedSession is not None
+
+    def getRefCount(self, session):
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.session is session:
+                    return entry.refCount
+        return 0
+
+    def discard(self, session, timeout=None):
+        # drop a session for every holder, only for sessions found dead as
+        # the server is closed under everyone still using it
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.session is session:
+                    del self._entries[key]
+        session.disconnect(self._disconnectTimeout if timeout is None else timeout)
+
+    def closeIdle(self):
+        with self._lock:
+            idleSessions = self.__PopIdle()
+        self.__Disconnect(idleSessions)
+
+    def __ScheduleReap(self, delay):
+        timer = threading.Timer(delay, self.__Reap)
+        timer.daemon = True
+        timer.start()
+
+    def __Reap(self):
+        # close what has expired and come back for sessions that are unused
+        # but not idle long enough yet
+        with self._lock:
+            idleSessions = self.__PopIdle()
+            remaining = [entry.lastUsed + self._idleTimeout - time.time() for entry in self._entries.values()
+                         if entry.refCount == 0 and entry.session is not None]
+        self.__Disconnect(idleSessions)
+        if len(remaining) > 0:
+            self.__ScheduleReap(max(min(remaining), 0.01))
+
+    def __PopIdle(self):
+        now = time.time()
+        idleSessions = list()
+        for key, entry in list(self._entries.items()):
+            if entry.refCount == 0 and entry.session is not None and now - entry.lastUsed >= self._idleTimeout:
+                idleSessions.append(entry.session)
+                del self._entries[key]
+        return idleSessions
+
+    def __Disconnect(self, sessions):
+        for session in sessions:
+            try:
+                session.disconnect(self._disconnectTimeout)
+            except Exception:
+                pass
+
+
+registry = IxNetSessionRegistry()
@@ -1,17 +1,32 @@
-from IxNetwork import IxNet
+from IxNetwork import IxNetError
+from IxNetworkSessions import registry as ixnetwork_sessions
 from cloudshell.api.cloudshell_api import CloudShellAPISession
 from cloudshell.core.logger.qs_logger import get_qs_logger
 from cloudshell.shell.core.resource_driver_interface import ResourceDriverInterface
 from cloudshell.shell.core.driver_context import InitCommandContext, ResourceCommandContext
 from collections import OrderedDict
+import threading
+import time
 
 
 class IxiaIxNetworkDriver(ResourceDriverInterface):
+    TEARDOWN_DISCONNECT_TIMEOUT = 30
+    PORT_READY_TIMEOUT = 300
+    PORT_READY_MIN_INTERVAL = 0.5
+    PORT_READY_MAX_INTERVAL = 8
+
+    # card ids are allocated from the configuration, which may be shared with other driver instances
+    _card_id_lock = threading.Lock()
+
     def cleanup(self):
         """
         Destroy the driver session, this function is called everytime a driver instance is destroyed
         This is a good place to close any open sessions, finish writing to log files
         """
+        if self.ixnetwork_session is not None:
+            ixnetwork_sessions.release(self.ixnetwork_session)
+            self.ixnetwork_session = None
+
         return
 
     def __init__(self):
@@ -21,8 +36,8 @@ class IxiaIxNetworkDriver(ResourceDriverInterface):
         self.cs_session = None
         self.ixnetwork_session = None
         self.logger = None
-        self.cards_in_chassis = 0
         self.chassis_card = {}
+        self.chassis_addresses = []
         self.reservation_description = None
         self.reservation_id = None
         self.resource_name = None
@@ -39,7 +54,7 @@ class IxiaIxNetworkDriver(ResourceDriverInterface):
 
         return
 
-    def add_card(self, context, card_address, num_ports):
+    def add_card(self, context, card_address, num_ports, wait_for_ports=True):
         if card_address in self.chassis_card.values():
             existing_card = self.chassis_card.keys()[self.chassis_card.values().index(card_address)]
             self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
@@ -54,41 +69,41 @@ class IxiaIxNetworkDriver(ResourceDriverInterface):
 
             root_path = self.ixnetwork_session.getRoot()
             available_hardware_path = root_path + '/availableHardware'
-            virtual_chassis_path = available_hardware_path + '/virtualChassis'
-
-            self.cards_in_chassis += 1
 
             virtual_chassis = self.ixnetwork_session.getList(available_hardware_path, 'virtualChassis')[0]
+            card_id = None
             try:
-                card = self.ixnetwork_session.add(virtual_chassis, 'ixVmCard')
-                self.ixnetwork_session.setMultiAttribute(card,
-                                                         '-managementIp', card_address,
-                                                         '-cardId', self.cards_in_chassis,
-                                                         '-keepAliveTimeout', '300')
-                self.ixnetwork_session.commit()
-
-                self.chassis_card[self.cards_in_chassis] = card_address
+                with self._card_id_lock:
+                    card_id = self._next_card_id(virtual_chassis)
+                    card = self.ixnetwork_session.add(virtual_chassis, 'ixVmCard')
+                    self.ixnetwork_session.setMultiAttribute(card,
+                                                             '-managementIp', card_address,
+                                                             '-cardId', card_id,
+                                                             '-keepAliveTimeout', '300')
+                    self.ixnetwork_session.commit()
+
+                self.chassis_card[card_id] = card_address
                 self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
                                                                 "[%s] Added Card %02d(%s)" %
                                                                 (self.resource_name,
-                                                                 self.cards_in_chassis,
-                                                                 self.chassis_card[self.cards_in_chassis]))
+                                                                 card_id,
+                                                                 self.chassis_card[card_id]))
             except Exception as e:
                 self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
                                                                 "[%s] Failed to add Card %02d(%s) to chassis, %s:%s" %
                                                                 (self.resource_name,
-                                                                 self.cards_in_chassis,
+                                                                 card_id or 0,
                                                                  card_address,
                                                                  e.__class__.__name__,
                                                                  e.message))
-                self.cards_in_chassis -= 1
-
                 raise
 
             current_port = None
             try:
-                virtual_card = self.ixnetwork_session.getList(virtual_chassis_path, 'ixVmCard')[
-                    self.cards_in_chassis - 1]
+                virtual_card = self.ixnetwork_session.getFilteredObject(virtual_chassis, 'ixVmCard',
+                                                                        '-managementIp', card_address)
+                if virtual_card == self.ixnetwork_session.getNull():
+                    raise IxNetError("Card %s not found in the chassis" % card_address)
                 for current_port in range(1, num_ports + 1):
                     port_root = self.ixnetwork_session.add(virtual_card, 'ixVmPort')
                     self.ixnetwork_session.setMultiAttribute(port_root,
@@ -100,17 +115,20 @@ class IxiaIxNetworkDriver(ResourceDriverInterface):
                                                                     "[%s] Added Port %02d to Card %02d" %
                                                                     (self.resource_name,
                                                                      current_port,
-                                                                     self.cards_in_chassis))
+                                                                     card_id))
             except Exception as e:
                 self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
                                                                 "[%s] Failed to add Port %02d to Card %02d, %s:%s" %
                                                                 (self.resource_name,
                                                                  current_port,
-                                                                 self.cards_in_chassis,
+                                                                 card_id,
                                                                  e.__class__.__name__,
                                                                  e.message))
                 raise
 
+            if wait_for_ports:
+                self._wait_for_ports_ready([card_address])
+
         return
 
     def add_chassis(self, context, chassis_address):
@@ -125,6 +143,7 @@ class IxiaIxNetworkDriver(ResourceDriverInterface):
         self.ixnetwork_session.setAttribute(chassis, '-hostname', chassis_address)
         self.ixnetwork_session.setAttribute(chassis, '-masterChassis', '')
         self.ixnetwork_session.commit()
+        self.chassis_addresses.append(chassis_address)
         try:
             self.ixnetwork_session.execute('connectToChassis', chassis_address)
             self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
@@ -173,8 +192,12 @@ class IxiaIxNetworkDriver(ResourceDriverInterface):
         license_server_name, license_server_resource = license_server.popitem()
         self.set_license_server(context, license_server_resource.FullAddress)
 
+        existing_cards = set(self.chassis_card.values())
         for card_name, card_resource in card.iteritems():
-            self.add_card(context, card_resource.FullAddress, 1)
+            self.add_card(context, card_resource.FullAddress, 1, wait_for_ports=False)
+
+        self._wait_for_ports_ready([self.chassis_card[card_id] for card_id in sorted(self.chassis_card)
+                                    if self.chassis_card[card_id] not in existing_cards])
         return
 
     def set_license_server(self, context, license_server_address):
@@ -200,12 +223,195 @@ class IxiaIxNetworkDriver(ResourceDriverInterface):
         self._refresh_reservation_details(context)
         self._ixnetwork_session_handler(context)
 
-        self.ixnetwork_session.disconnect()
+        # the session may be shared, it is only disconnected by its last holder
+        ixnetwork_session, self.ixnetwork_session = self.ixnetwork_session, None
+        ixnetwork_sessions.release(ixnetwork_session, closeUnused=True)
+
+        return
+
+    def fast_teardown(self, context):
+        """
+        Stop traffic and protocols, remove all cards and chassis in a single commit and then disconnect,
+        so that licenses and IxVM cards are freed immediately instead of when the session times out.
+        When the session is shared only the cards and chassis added by this driver are removed and the
+        session is left running for the other holders
+        :param ResourceCommandContext context: the context the command runs on
+        """
+        self._cs_session_handler(context)
+        self._refresh_reservation_details(context)
+        self._ixnetwork_session_handler(context)
+
+        root_path = self.ixnetwork_session.getRoot()
+        available_hardware_path = root_path + '/availableHardware'
+
+        phase_times = OrderedDict()
+
+        start_time = time.time()
+        pending_results = []
+        other_holders = ixnetwork_sessions.getRefCount(self.ixnetwork_session) - 1
+        if other_holders > 0:
+            self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
+                                                            "[%s] Session shared with %s other holder(s), "
+                                                            "leaving traffic and protocols running" %
+                                                            (self.resource_name,
+                                                             other_holders))
+        else:
+            for command in (('stop', root_path + '/traffic'), ('stopAllProtocols',)):
+                try:
+                    pending_results.append((command[0], self.ixnetwork_session.setAsync().execute(*command)))
+                except Exception as e:
+                    self._write_teardown_failure(command[0], e)
+
+        for command_name, result_id in pending_results:
+            try:
+                self.ixnetwork_session.wait(result_id)
+            except Exception as e:
+                self._write_teardown_failure(command_name, e)
+        phase_times['stop'] = time.time() - start_time
+
+        start_time = time.time()
+        try:
+            virtual_chassis = self.ixnetwork_session.getList(available_hardware_path, 'virtualChassis')[0]
+            if other_holders > 0:
+                # other holders keep their hardware, only what this driver added is released
+                virtual_cards = [self.ixnetwork_session.getFilteredObject(virtual_chassis, 'ixVmCard',
+                                                                          '-managementIp', card_address)
+                                 for card_address in self.chassis_card.values()]
+                chassis = [self.ixnetwork_session.getFilteredObject(available_hardware_path, 'chassis',
+                                                                    '-hostname', chassis_address)
+                           for chassis_address in self.chassis_addresses]
+                virtual_cards = [card for card in virtual_cards if card != self.ixnetwork_session.getNull()]
+                chassis = [hardware for hardware in chassis if hardware != self.ixnetwork_session.getNull()]
+            else:
+                # the last holder releases everything, including hardware added by a previous driver instance
+                virtual_cards = self.ixnetwork_session.getList(virtual_chassis, 'ixVmCard')
+                chassis = self.ixnetwork_session.getList(available_hardware_path, 'chassis')
+            self.ixnetwork_session.removeList(virtual_cards + chassis)
+            self.ixnetwork_session.commit()
+            self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
+                                                            "[%s] Released %s card(s) and %s chassis" %
+                                                            (self.resource_name,
+                                                             len(virtual_cards),
+                                                             len(chassis)))
+        except Exception as e:
+            self._write_teardown_failure('release', e)
+        self.chassis_card = {}
+        self.chassis_addresses = []
+        phase_times['release'] = time.time() - start_time
+
+        start_time = time.time()
+        ixnetwork_session, self.ixnetwork_session = self.ixnetwork_session, None
+        try:
+            ixnetwork_sessions.release(ixnetwork_session, closeUnused=True, timeout=self.TEARDOWN_DISCONNECT_TIMEOUT)
+        except Exception as e:
+            self._write_teardown_failure('disconnect', e)
+        phase_times['disconnect'] = time.time() - start_time
+
+        self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
+                                                        "[%s] Teardown completed, %s" %
+                                                        (self.resource_name,
+                                                         ', '.join("%s %.2fs" % (phase, elapsed)
+                                                                   for phase, elapsed in phase_times.items())))
+
+        return
+
+    def _next_card_id(self, virtual_chassis):
+        card_ids = set(int(self.ixnetwork_session.getAttribute(card, '-cardId'))
+                       for card in self.ixnetwork_session.getList(virtual_chassis, 'ixVmCard'))
+        card_id = 1
+        while card_id in card_ids:
+            card_id += 1
+
+        return card_id
+
+    def _wait_for_ports_ready(self, card_addresses):
+        root_path = self.ixnetwork_session.getRoot()
+        available_hardware_path = root_path + '/availableHardware'
+
+        virtual_chassis = self.ixnetwork_session.getList(available_hardware_path, 'virtualChassis')[0]
+        card_numbers = dict((card_address, card_number) for card_number, card_address in self.chassis_card.items())
+
+        pending_cards = set()
+        pending_ports = {}
+        labels = {}
+        for card_address in card_addresses:
+            virtual_card = self.ixnetwork_session.getFilteredObject(virtual_chassis, 'ixVmCard',
+                                                                    '-managementIp', card_address)
+            if virtual_card == self.ixnetwork_session.getNull():
+                continue
+            labels[virtual_card] = "Card %02d(%s)" % (card_numbers.get(card_address, 0), card_address)
+            pending_cards.add(virtual_card)
+            pending_ports[virtual_card] = set(self.ixnetwork_session.getList(virtual_card, 'ixVmPort'))
+            for port in pending_ports[virtual_card]:
+                labels[port] = "Port %02d on %s" % (int(self.ixnetwork_session.getAttribute(port, '-portId')),
+                                                    labels[virtual_card])
+
+        # one filtered read covers the state of every card, then one per ready card covers its ports,
+        # backing off while nothing changes
+        start_time = time.time()
+        deadline = start_time + self.PORT_READY_TIMEOUT
+        interval = self.PORT_READY_MIN_INTERVAL
+        while True:
+            ready = set()
+            if len(pending_cards) > 0:
+                ready_cards = pending_cards.intersection(self.ixnetwork_session.iterFilteredList(virtual_chassis,
+                                                                                                'ixVmCard',
+                                                                                                '-cardState',
+                                                                                                'cardOK'))
+                pending_cards.difference_update(ready_cards)
+                ready.update(ready_cards)
+
+            for virtual_card, ports in list(pending_ports.items()):
+                if virtual_card in pending_cards:
+                    continue
+                if len(ports) > 0:
+                    ready_ports = ports.intersection(self.ixnetwork_session.iterFilteredList(virtual_card, 'ixVmPort',
+                                                                                            '-portState', 'portOK'))
+                    ports.difference_update(ready_ports)
+                    ready.update(ready_ports)
+                if len(ports) == 0:
+                    del pending_ports[virtual_card]
+
+            for ready_object in sorted(ready, key=lambda ready_object: labels[ready_object]):
+                self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
+                                                                "[%s] %s ready after %.1fs" %
+                                                                (self.resource_name,
+                                                                 labels[ready_object],
+                                                                 time.time() - start_time))
+
+            remaining = deadline - time.time()
+            if len(pending_ports) == 0 or remaining <= 0:
+                break
+
+            interval = self.PORT_READY_MIN_INTERVAL if len(ready) > 0 else min(interval * 2,
+                                                                                self.PORT_READY_MAX_INTERVAL)
+            time.sleep(min(interval, remaining))
+
+        not_ready = sorted(labels[pending] for pending in pending_cards.union(*pending_ports.values()))
+        for label in not_ready:
+            self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
+                                                            "[%s] %s not ready after %ss" %
+                                                            (self.resource_name,
+                                                             label,
+                                                             self.PORT_READY_TIMEOUT))
+        if len(not_ready) > 0:
+            raise IxNetError("Not ready after %ss: %s" % (self.PORT_READY_TIMEOUT, ', '.join(not_ready)))
 
         return
 
+    def _write_teardown_failure(self, phase, e):
+        self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
+                                                        "[%s] Teardown %s failed, %s:%s" %
+                                                        (self.resource_name,
+                                                         phase,
+                                                         e.__class__.__name__,
+                                                         e.message))
+
     def _ixnetwork_session_handler(self, context):
         try:
+            # a shared session may have been disconnected by another holder
+            if not self.ixnetwork_session.isConnected():
+                raise IxNetError('not connected')
             self.ixnetwork_session.getVersion()
         except (AttributeError, Exception) as e:
             if e.__class__ != AttributeError:
@@ -215,13 +421,19 @@ class IxiaIxNetworkDriver(ResourceDriverInterface):
                                                                  e.__class__.__name__,
                                                                  e.message))
 
+                # the shared session is dead for every holder, drop it so the next acquire reconnects
+                ixnetwork_session, self.ixnetwork_session = self.ixnetwork_session, None
+                try:
+                    ixnetwork_sessions.discard(ixnetwork_session)
+                except Exception:
+                    pass
+
             utility_server_name, utility_server_resource = self.utility_server.popitem()
             api_address = utility_server_resource.FullAddress
             api_port = context.resource.attributes['API Port']
             api_version = context.resource.attributes['API Version']
             try:
-                self.ixnetwork_session = IxNet()
-                self.ixnetwork_session.connect(api_address, '-port', api_port, '-version', api_version)
+                self.ixnetwork_session = ixnetwork_sessions.acquire(api_address, api_port, api_version)
                 self.cs_session.WriteMessageToReservationOutput(self.reservation_id,
                                                                 "[%s] Connected to API v%s at %s:%s" %
                                                                 (self.resource_name,
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+Recordings and local endpoints for driving a real `IxNet` client in tests
+"""
+
+import socket
+import struct
+import threading
+import time
+
+from IxNetwork import RECORD_HEADER, RECORD_CONNECT, RECORD_SEND, RECORD_RECV
+
+HANDSHAKE = b'<0041>0<0097>session'
+
+
+def request(*args):
+    content = ('\02'.join(args) + '\03').encode('ascii')
+    return b'<001><002><009' + str(len(content)).encode('ascii') + b'>' + content
+
+
+def response(content):
+    content = content.encode('ascii')
+    return b'<0041>0<009' + str(len(content)).encode('ascii') + b'>' + content
+
+
+def session_records(exchanges):
+    """
+    Records of one session that answers connect, the client version check,
+    every (request, response) in exchanges and the final disconnect
+    """
+    records = [(RECORD_CONNECT, 0.0, b''),
+               (RECORD_RECV, 0.0, HANDSHAKE),
+               (RECORD_SEND, 0.0, request('ixNet', 'connect')),
+               (RECORD_RECV, 0.0, response('::ixNet::OK')),
+               (RECORD_SEND, 0.0, request('ixNet', 'getVersion')),
+               (RECORD_RECV, 0.0, response('8.10.1046.6'))]
+    for sent, received in list(exchanges) + [(request('ixNet', 'disconnect'), response('::ixNet::OK'))]:
+        records.append((RECORD_SEND, 0.0, sent))
+        records.append((RECORD_RECV, 0.0, received))
+
+    return records
+
+
+def write_recording(filename, records):
+    fid = open(filename, 'wb')
+    for direction, timestamp, content in records:
+        fid.write(struct.pack(RECORD_HEADER, direction, timestamp, len(content)))
+        fid.write(content)
+    fid.close()
+
+
+class FakeServer(object):
+    """
+    Local IxNetwork endpoint answering every request on every connection,
+    getVersion and connect are answered as a server would and any other
+    command is echoed back, commands in trickle are answered one byte per
+    byte_delay seconds, with refuse connections are closed instead of
+    answered once handshake_delay has passed
+    """
+
+    def __init__(self, trickle=(), byte_delay=0, handshake_delay=0, refuse=False):
+        self.trickle = trickle
+        self.byte_delay = byte_delay
+        self.handshake_delay = handshake_delay
+        self.refuse = refuse
+        self.connections = 0
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen(8)
+        self.port = self._socket.getsockname()[1]
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._socket.close()
+
+    def respond(self, command, payload):
+        if command == 'getVersion':
+            return '8.10.1046.6'
+        if command in ('connect', 'disconnect'):
+            return '::ixNet::OK'
+        return payload
+
+    def _accept(self):
+        while True:
+            try:
+                client_socket, client_address = self._socket.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self._serve, args=(client_socket,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, client_socket):
+        try:
+            time.sleep(self.handshake_delay)
+            if self.refuse:
+                return
+            client_socket.sendall(HANDSHAKE)
+            while True:
+                payload = self._recv_request(client_socket)
+                if payload is None:
+                    break
+                command = payload.split('\02')[1].rstrip('\03')
+                content = response(self.respond(command, payload))
+                if command in self.trickle:
+                    for index in range(len(content)):
+                        time.sleep(self.byte_delay)
+                        client_socket.sendall(content[index:index + 1])
+                else:
+                    client_socket.sendall(content)
+        except socket.error:
+            pass
+        finally:
+            client_socket.close()
+
+    def _recv_request(self, client_socket):
+        buffer = b''
+        while True:
+            chunk = client_socket.recv(1)
+            if len(chunk) == 0:
+                return None
+            buffer += chunk
+            tag_start = buffer.rfind(b'<009')
+            if tag_start != -1 and buffer.endswith(b'>'):
+                length = int(buffer[tag_start + 4:-1])
+                payload = b''
+                while len(payload) < length:
+                    chunk = client_socket.recv(length - len(payload))
+                    if len(chunk) == 0:
+                        return None
+                    payload += chunk
+                return payload.decode('ascii')
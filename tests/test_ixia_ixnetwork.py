@@ -7,13 +7,33 @@ Tests for `IxiaIxNetworkDriver`
 
 import unittest
 
+import mock
+
+from IxNetwork import IxNetError
 from driver import IxiaIxNetworkDriver
 
+VIRTUAL_CHASSIS = '::ixNet::OBJ-/availableHardware/virtualChassis'
+
 
 class TestIxiaIxNetworkDriver(unittest.TestCase):
 
     def setUp(self):
-        pass
+        self.driver = IxiaIxNetworkDriver()
+        self.driver.resource_name = 'IxNetwork'
+        self.driver.cs_session = mock.Mock()
+        self.driver._cs_session_handler = mock.Mock()
+        self.driver._refresh_reservation_details = mock.Mock()
+        self.driver._ixnetwork_session_handler = mock.Mock()
+
+        self.session = mock.Mock()
+        self.session.getRoot.return_value = '::ixNet::OBJ-/'
+        self.session.getNull.return_value = '::ixNet::OBJ-null'
+        self.session.setAsync.return_value = self.session
+        self.driver.ixnetwork_session = self.session
+
+        patcher = mock.patch('driver.ixnetwork_sessions')
+        self.sessions = patcher.start()
+        self.addCleanup(patcher.stop)
 
     def tearDown(self):
         pass
@@ -21,6 +41,174 @@ class TestIxiaIxNetworkDriver(unittest.TestCase):
     def test_000_something(self):
         pass
 
+    def _output(self):
+        return [call[0][1] for call in self.driver.cs_session.WriteMessageToReservationOutput.call_args_list]
+
+    def _filtered_hardware(self, objRef, child, name, value):
+        return {
+            ('ixVmCard', '10.0.0.1'): VIRTUAL_CHASSIS + '/ixVmCard:1',
+            ('ixVmCard', '10.0.0.2'): VIRTUAL_CHASSIS + '/ixVmCard:2',
+            ('chassis', '10.0.0.100'): '::ixNet::OBJ-/availableHardware/chassis:1',
+        }.get((child, value), '::ixNet::OBJ-null')
+
+    def _removed(self):
+        return sorted(ref for call in self.session.removeList.call_args_list for ref in call[0][0])
+
+    def test_fast_teardown_releases_all_hardware_in_one_commit(self):
+        cards = [VIRTUAL_CHASSIS + '/ixVmCard:1', VIRTUAL_CHASSIS + '/ixVmCard:2']
+        chassis = ['::ixNet::OBJ-/availableHardware/chassis:1']
+        self.session.getList.side_effect = lambda objRef, child: {
+            'virtualChassis': [VIRTUAL_CHASSIS],
+            'ixVmCard': cards,
+            'chassis': chassis,
+        }[child]
+        self.sessions.getRefCount.return_value = 1
+
+        # nothing was added by this driver instance, the last holder still releases everything
+        self.driver.fast_teardown(mock.Mock())
+
+        self.session.execute.assert_any_call('stop', '::ixNet::OBJ-//traffic')
+        self.session.execute.assert_any_call('stopAllProtocols')
+        self.session.getFilteredObject.assert_not_called()
+        self.session.remove.assert_not_called()
+        self.assertEqual(self._removed(), sorted(chassis + cards))
+        self.assertEqual(self.session.commit.call_count, 1)
+        self.sessions.release.assert_called_once_with(self.session, closeUnused=True,
+                                                      timeout=IxiaIxNetworkDriver.TEARDOWN_DISCONNECT_TIMEOUT)
+        self.sessions.discard.assert_not_called()
+        self.assertIsNone(self.driver.ixnetwork_session)
+        self.assertIn("[IxNetwork] Released 2 card(s) and 1 chassis", self._output())
+        self.assertTrue(self._output()[-1].startswith("[IxNetwork] Teardown completed, stop "))
+
+    def test_fast_teardown_releases_own_hardware_of_shared_session(self):
+        self.driver.chassis_card = {1: '10.0.0.1', 2: '10.0.0.2', 3: '10.0.0.3'}
+        self.driver.chassis_addresses = ['10.0.0.100']
+        self.session.getList.return_value = [VIRTUAL_CHASSIS]
+        self.session.getFilteredObject.side_effect = self._filtered_hardware
+        self.sessions.getRefCount.return_value = 3
+
+        self.driver.fast_teardown(mock.Mock())
+
+        self.session.execute.assert_not_called()
+        self.assertIn("[IxNetwork] Session shared with 2 other holder(s), leaving traffic and protocols running",
+                      self._output())
+        self.assertEqual(self._removed(),
+                         ['::ixNet::OBJ-/availableHardware/chassis:1',
+                          VIRTUAL_CHASSIS + '/ixVmCard:1',
+                          VIRTUAL_CHASSIS + '/ixVmCard:2'])
+        self.assertEqual(self.session.commit.call_count, 1)
+        self.assertEqual(self.sessions.release.call_count, 1)
+        self.assertEqual(self.driver.chassis_card, {})
+        self.assertIn("[IxNetwork] Released 2 card(s) and 1 chassis", self._output())
+
+    def test_fast_teardown_continues_after_failed_phase(self):
+        self.session.execute.side_effect = IxNetError('traffic is not running')
+        self.session.getList.return_value = [VIRTUAL_CHASSIS]
+        self.sessions.getRefCount.return_value = 1
+
+        self.driver.fast_teardown(mock.Mock())
+
+        self.assertIn("[IxNetwork] Teardown stop failed, IxNetError:traffic is not running", self._output())
+        self.assertEqual(self.session.commit.call_count, 1)
+        self.assertEqual(self.sessions.release.call_count, 1)
+
+    def test_teardown_releases_shared_session(self):
+        self.driver.teardown(mock.Mock())
+
+        self.sessions.release.assert_called_once_with(self.session, closeUnused=True)
+        self.session.disconnect.assert_not_called()
+        self.assertIsNone(self.driver.ixnetwork_session)
+
+    def test_add_card_takes_first_free_card_id(self):
+        cards = [VIRTUAL_CHASSIS + '/ixVmCard:1', VIRTUAL_CHASSIS + '/ixVmCard:2']
+        self.session.getList.side_effect = lambda objRef, child: {
+            'virtualChassis': [VIRTUAL_CHASSIS],
+            'ixVmCard': cards,
+        }[child]
+        self.session.getAttribute.side_effect = lambda objRef, name: {cards[0]: '1', cards[1]: '3'}[objRef]
+        self.session.add.return_value = VIRTUAL_CHASSIS + '/ixVmCard:3'
+        self.session.getFilteredObject.return_value = VIRTUAL_CHASSIS + '/ixVmCard:3'
+
+        self.driver.add_card(mock.Mock(), '10.0.0.1', 0, wait_for_ports=False)
+
+        self.session.setMultiAttribute.assert_called_once_with(VIRTUAL_CHASSIS + '/ixVmCard:3',
+                                                               '-managementIp', '10.0.0.1',
+                                                               '-cardId', 2,
+                                                               '-keepAliveTimeout', '300')
+        self.assertEqual(self.driver.chassis_card, {2: '10.0.0.1'})
+        self.assertIn("[IxNetwork] Added Card 02(10.0.0.1)", self._output())
+
+    def _provisioned_card(self, ready_after):
+        # the card comes up on the first poll, port 2 on the second port poll and port 1 on poll ready_after
+        card = VIRTUAL_CHASSIS + '/ixVmCard:1'
+        ports = [card + '/ixVmPort:1', card + '/ixVmPort:2']
+        polls = []
+
+        def filtered(objRef, child, name, value):
+            if child == 'ixVmCard':
+                return iter([card])
+            polls.append(objRef)
+            if len(polls) >= ready_after:
+                return iter(ports)
+            return iter([ports[1]] if len(polls) >= 2 else [])
+
+        self.driver.chassis_card = {1: '10.0.0.1'}
+        self.driver.PORT_READY_MIN_INTERVAL = 0.001
+        self.driver.PORT_READY_MAX_INTERVAL = 0.002
+        self.session.getList.side_effect = lambda objRef, child: {
+            'virtualChassis': [VIRTUAL_CHASSIS],
+            'ixVmPort': ports,
+        }[child]
+        self.session.getFilteredObject.return_value = card
+        self.session.getAttribute.side_effect = lambda objRef, name: {ports[0]: '7', ports[1]: '8'}[objRef]
+        self.session.iterFilteredList.side_effect = filtered
+
+    def test_wait_for_ports_reports_each_port_by_port_id(self):
+        self._provisioned_card(ready_after=3)
+
+        self.driver._wait_for_ports_ready(['10.0.0.1'])
+
+        output = self._output()
+        self.assertTrue(output[0].startswith("[IxNetwork] Card 01(10.0.0.1) ready after "))
+        self.assertTrue(output[1].startswith("[IxNetwork] Port 08 on Card 01(10.0.0.1) ready after "))
+        self.assertTrue(output[2].startswith("[IxNetwork] Port 07 on Card 01(10.0.0.1) ready after "))
+        self.assertEqual(len(output), 3)
+
+    def test_wait_for_ports_raises_after_deadline(self):
+        self._provisioned_card(ready_after=1000)
+        self.driver.PORT_READY_TIMEOUT = 0.05
+
+        with self.assertRaises(IxNetError) as raised:
+            self.driver._wait_for_ports_ready(['10.0.0.1'])
+
+        self.assertIn("Port 07 on Card 01(10.0.0.1)", str(raised.exception))
+        self.assertIn("[IxNetwork] Port 07 on Card 01(10.0.0.1) not ready after 0.05s", self._output())
+
+    def test_configure_via_sandbox_waits_only_for_added_cards(self):
+        def resource(address):
+            return mock.Mock(FullAddress=address)
+
+        def add_card(context, card_address, num_ports, wait_for_ports=True):
+            if card_address not in self.driver.chassis_card.values():
+                self.driver.chassis_card[len(self.driver.chassis_card) + 1] = card_address
+
+        self.driver.resource = {
+            'Ixia Virtual Application': {
+                'Ixia IxVM Chassis': {'chassis': resource('10.0.0.100')},
+                'Ixia IxVM Card': {'card 1': resource('10.0.0.1'), 'card 2': resource('10.0.0.2')},
+            },
+            'Ixia Application': {'Ixia License Server': {'license': resource('10.0.0.200')}},
+        }
+        self.driver.chassis_card = {1: '10.0.0.1'}
+        self.driver.add_chassis = mock.Mock()
+        self.driver.set_license_server = mock.Mock()
+        self.driver.add_card = mock.Mock(side_effect=add_card)
+        self.driver._wait_for_ports_ready = mock.Mock()
+
+        self.driver.configure_via_sandbox(mock.Mock())
+
+        self.driver._wait_for_ports_ready.assert_called_once_with(['10.0.0.2'])
+
 
 if __name__ == '__main__':
     import sys
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `IxNet`
+"""
+
+import threading
+import time
+import unittest
+
+from IxNetwork import IxNet, IxNetError
+from tests.ixnet_servers import FakeServer
+
+VPORTS = {
+    '::ixNet::OBJ-/vport:1': {'-name': 'east', '-type': 'ethernet'},
+    '::ixNet::OBJ-/vport:2': {'-name': 'west', '-type': 'ethernet'},
+    '::ixNet::OBJ-/vport:3': {'-name': 'west', '-type': 'pos'},
+}
+
+
+class VportServer(FakeServer):
+    def __init__(self, *args, **kwargs):
+        FakeServer.__init__(self, *args, **kwargs)
+        self.requests = []
+
+    def respond(self, command, payload):
+        args = payload.rstrip('\03').split('\02')[2:]
+        if command == 'getFilteredList':
+            self.requests.append(command)
+            if args[1] == 'null':
+                return '::ixNet::OBJ-null'
+            return '\01' + repr([str(ref) for ref in sorted(VPORTS) if VPORTS[ref].get(args[2]) == args[3]])
+        if command == 'getAttribute':
+            self.requests.append(command)
+            return VPORTS[args[0]][args[1]]
+        return FakeServer.respond(self, command, payload)
+
+
+class TestIxNet(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer(byte_delay=0.1)
+        self.session = IxNet()
+        self.session.connect('127.0.0.1', '-port', self.server.port)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_disconnect_timeout_bounds_whole_exchange(self):
+        # every byte arrives well within the timeout, the whole response does not
+        self.server.trickle = ('disconnect',)
+        start_time = time.time()
+        self.assertRaises(IxNetError, self.session.disconnect, 0.5)
+
+        self.assertLess(time.time() - start_time, 1)
+        self.assertFalse(self.session.isConnected())
+
+    def test_shared_session_keeps_thread_requests_apart(self):
+        failures = []
+
+        def buffered(thread):
+            objRef = '::ixNet::OBJ-/vport:%s' % thread
+            for index in range(50):
+                self.session.setAttribute(objRef, '-name', index)
+                result = self.session.getAttribute(objRef, '-name')
+                if result != 'ixNet\02setAttribute\02%s\02-name\02%s\03ixNet\02getAttribute\02%s\02-name\03' % (
+                        objRef, index, objRef):
+                    failures.append(result)
+
+        def unbuffered(thread):
+            for index in range(50):
+                if thread % 2 == 0:
+                    result = self.session.setAsync().execute('start', thread)
+                    expected = 'ixNet\02-async\02exec\02start\02%s\03' % thread
+                else:
+                    result = self.session.getList('::ixNet::OBJ-/', thread)
+                    expected = 'ixNet\02getList\02::ixNet::OBJ-/\02%s\03' % thread
+                if result != expected:
+                    failures.append(result)
+
+        threads = [threading.Thread(target=buffered if thread < 4 else unbuffered, args=(thread,))
+                   for thread in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+
+        self.assertEqual(failures, [])
+
+    def test_async_flag_reset_when_execute_fails(self):
+        self.session.disconnect()
+
+        self.assertRaises(IxNetError, self.session.setAsync().execute, 'stopAllProtocols')
+        self.session.connect('127.0.0.1', '-port', self.server.port)
+        self.assertEqual(self.session.execute('stopAllProtocols'), 'ixNet\02exec\02stopAllProtocols\03')
+        self.session.disconnect(5)
+
+    def test_remove_list_sent_with_commit(self):
+        objRefs = ['::ixNet::OBJ-/availableHardware/chassis:1', '::ixNet::OBJ-/availableHardware/chassis:2']
+
+        self.assertEqual(self.session.removeList(objRefs), '::ixNet::OK')
+        self.assertEqual(self.session.commit(),
+                         'ixNet\02remove\02%s\03ixNet\02remove\02%s\03ixNet\02commit\03' % tuple(objRefs))
+
+
+class TestIxNetFilteredList(unittest.TestCase):
+
+    def setUp(self):
+        self.server = VportServer()
+        self.session = IxNet()
+        self.session.connect('127.0.0.1', '-port', self.server.port)
+
+    def tearDown(self):
+        self.session.disconnect(5)
+        self.server.stop()
+
+    def test_get_filtered_list_matches_on_server(self):
+        self.assertEqual(self.session.getFilteredList('::ixNet::OBJ-/', 'vport', '-name', 'west'),
+                         ['::ixNet::OBJ-/vport:2', '::ixNet::OBJ-/vport:3'])
+
+    def test_filtered_object_found(self):
+        self.assertEqual(self.session.getFilteredObject('::ixNet::OBJ-/', 'vport', '-name', 'east'),
+                         '::ixNet::OBJ-/vport:1')
+        self.assertEqual(self.server.requests, ['getFilteredList'])
+
+    def test_filtered_object_not_found(self):
+        self.assertEqual(self.session.getFilteredObject('::ixNet::OBJ-/', 'vport', '-name', 'north'),
+                         self.session.getNull())
+        self.assertEqual(self.session.getFilteredObject('::ixNet::OBJ-/', 'null', '-name', 'east'),
+                         self.session.getNull())
+        self.assertEqual(list(self.session.iterFilteredList('::ixNet::OBJ-/', 'null', '-name', 'east')), [])
+
+    def test_extra_filters_checked_lazily(self):
+        filtered = self.session.iterFilteredList('::ixNet::OBJ-/', 'vport', '-name', 'west', '-type', 'pos')
+        self.assertEqual(self.server.requests, ['getFilteredList'])
+
+        self.assertEqual(list(filtered), ['::ixNet::OBJ-/vport:3'])
+        self.assertEqual(self.server.requests, ['getFilteredList', 'getAttribute', 'getAttribute'])
+
+    def test_filters_must_be_pairs(self):
+        self.assertRaises(IxNetError, self.session.iterFilteredList, '::ixNet::OBJ-/', 'vport')
+        self.assertRaises(IxNetError, self.session.iterFilteredList, '::ixNet::OBJ-/', 'vport', '-name')
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
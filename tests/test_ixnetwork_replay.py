@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `IxNet` recording and `IxNetReplayServer`
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from IxNetwork import IxNet, IxNetError
+from IxNetworkReplay import IxNetReplayServer, readRecording
+from tests.ixnet_servers import request, response, session_records, write_recording
+
+
+class TestIxNetReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.recording = os.path.join(self.directory, 'session.rec')
+        write_recording(self.recording, session_records([
+            (request('ixNet', 'help'), response('::ixNet::OK')),
+            (request('ixNet', 'getVersion'), response('8.10.1046.6')),
+        ]))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _replay(self, filename, record=None, port=0, commands=('help', 'getVersion')):
+        server = IxNetReplayServer(filename, port=port, timeScale=0, recvTimeout=5)
+        port = server.start()
+        session = IxNet()
+        session.setRecord(record)
+        session.connect('127.0.0.1', '-port', port)
+        results = [getattr(session, command)() for command in commands]
+        session.disconnect()
+        server.stop(5)
+        return server, results
+
+    def test_replay_serves_recorded_responses(self):
+        server, results = self._replay(self.recording)
+
+        self.assertEqual(results, ['::ixNet::OK', '8.10.1046.6'])
+        self.assertEqual(server.getErrors(), [])
+        # only the connect request carries the live port and differs from the recording
+        self.assertEqual([mismatch[1] for mismatch in server.getMismatches()], [0])
+
+    def test_recording_round_trips(self):
+        rerecording = os.path.join(self.directory, 'rerecorded.rec')
+        server, results = self._replay(self.recording, rerecording)
+
+        original = [[(d, c) for d, t, c in s][2:] for s in readRecording(self.recording)]
+        rerecorded = [[(d, c) for d, t, c in s][2:] for s in readRecording(rerecording)]
+        self.assertEqual(rerecorded, original)
+
+        server, results = self._replay(rerecording, port=server.getPort())
+        self.assertEqual(results, ['::ixNet::OK', '8.10.1046.6'])
+        self.assertEqual(server.getMismatches(), [])
+
+    def test_recording_started_after_connect_replays(self):
+        server = IxNetReplayServer(self.recording, timeScale=0, recvTimeout=5)
+        port = server.start()
+        rerecording = os.path.join(self.directory, 'rerecorded.rec')
+        session = IxNet()
+        session.connect('127.0.0.1', '-port', port)
+        session.setRecord(rerecording)
+        session.help()
+        session.getVersion()
+        session.disconnect()
+        server.stop(5)
+
+        self.assertEqual(len(readRecording(rerecording)), 1)
+        server, results = self._replay(rerecording, port=server.getPort())
+        self.assertEqual(results, ['::ixNet::OK', '8.10.1046.6'])
+        self.assertEqual(server.getMismatches(), [])
+        self.assertEqual(server.getErrors(), [])
+
+    def test_dropped_request_is_skipped(self):
+        server, results = self._replay(self.recording, commands=('getVersion',))
+
+        self.assertEqual(results, ['8.10.1046.6'])
+        self.assertEqual(server.getErrors(), [])
+        self.assertIn((0, 2, request('ixNet', 'help'), None), server.getMismatches())
+
+    def test_idle_client_times_out(self):
+        server = IxNetReplayServer(self.recording, timeScale=0, recvTimeout=0.2)
+        port = server.start()
+        session = IxNet()
+        session.connect('127.0.0.1', '-port', port)
+        server.stop(5)
+
+        self.assertRaises(IxNetError, session.help)
+        self.assertEqual(len(server.getErrors()), 1)
+        self.assertIn('timed out waiting for request 2', server.getErrors()[0])
+
+    def test_unexpected_request_closes_session(self):
+        server = IxNetReplayServer(self.recording, timeScale=0, recvTimeout=5)
+        port = server.start()
+        session = IxNet()
+        session.connect('127.0.0.1', '-port', port)
+        session.help()
+        session.getVersion()
+
+        # answered in order with the recorded disconnect response, then past the end of the recording
+        self.assertEqual(session.help('more'), '::ixNet::OK')
+        self.assertRaises(IxNetError, session.help, 'more')
+        server.stop(5)
+
+        self.assertIn((0, 4, request('ixNet', 'disconnect'), request('ixNet', 'help', 'more')),
+                      server.getMismatches())
+        self.assertEqual(len(server.getErrors()), 1)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for `IxNetSessionRegistry`
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from IxNetwork import IxNetError
+from IxNetworkReplay import readRecording
+from IxNetworkSessions import IxNetSessionRegistry
+from tests.ixnet_servers import FakeServer
+
+
+class TestIxNetSessionRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer(handshake_delay=0.2)
+        self.registry = IxNetSessionRegistry(idleTimeout=60, disconnectTimeout=5)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _acquire_concurrently(self, count):
+        sessions = []
+        errors = []
+
+        def acquire():
+            try:
+                sessions.append(self.registry.acquire('127.0.0.1', self.server.port, '8.10'))
+            except IxNetError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=acquire) for thread in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        return sessions, errors
+
+    def test_concurrent_acquire_shares_one_connection(self):
+        sessions, errors = self._acquire_concurrently(4)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(sessions), 4)
+        self.assertTrue(all(session is sessions[0] for session in sessions))
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.registry.getRefCount(sessions[0]), 4)
+
+    def test_failed_connect_raises_for_every_waiter(self):
+        self.server.refuse = True
+
+        sessions, errors = self._acquire_concurrently(4)
+
+        self.assertEqual(sessions, [])
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(self.server.connections, 1)
+
+        # the failed attempt is not cached, the next caller connects again
+        self.server.refuse = False
+        self.assertTrue(self.registry.acquire('127.0.0.1', self.server.port, '8.10').isConnected())
+        self.assertEqual(self.server.connections, 2)
+
+    def test_release_closes_only_for_last_holder(self):
+        sessions, errors = self._acquire_concurrently(2)
+
+        self.assertFalse(self.registry.release(sessions[0], closeUnused=True))
+        self.assertTrue(sessions[0].isConnected())
+        self.assertTrue(self.registry.release(sessions[1], closeUnused=True))
+        self.assertFalse(sessions[0].isConnected())
+
+    def test_idle_session_closed_without_further_calls(self):
+        self.registry = IxNetSessionRegistry(idleTimeout=0.2, disconnectTimeout=5)
+        session = self.registry.acquire('127.0.0.1', self.server.port, '8.10')
+
+        self.registry.release(session)
+        self.assertTrue(session.isConnected())
+
+        time.sleep(1)
+        self.assertFalse(session.isConnected())
+        self.assertEqual(self.registry.getRefCount(session), 0)
+
+    def test_discard_drops_session_for_every_holder(self):
+        sessions, errors = self._acquire_concurrently(2)
+
+        self.registry.discard(sessions[0])
+
+        self.assertFalse(sessions[0].isConnected())
+        self.assertEqual(self.registry.getRefCount(sessions[0]), 0)
+        session = self.registry.acquire('127.0.0.1', self.server.port, '8.10')
+        self.assertIsNot(session, sessions[0])
+        self.assertEqual(self.server.connections, 2)
+
+    def test_closed_session_is_replaced(self):
+        session = self.registry.acquire('127.0.0.1', self.server.port, '8.10')
+        session._IxNet__Close()
+
+        replacement = self.registry.acquire('127.0.0.1', self.server.port, '8.10')
+
+        self.assertIsNot(replacement, session)
+        self.assertTrue(replacement.isConnected())
+        self.assertEqual(self.registry.getRefCount(replacement), 1)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_sessions_recorded_to_environment_directory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        os.environ['IXNET_RECORD_DIR'] = directory
+        self.addCleanup(os.environ.pop, 'IXNET_RECORD_DIR')
+
+        session = self.registry.acquire('127.0.0.1', self.server.port, '8.10')
+        session.help()
+        self.registry.release(session, closeUnused=True)
+
+        recordings = os.listdir(directory)
+        self.assertEqual(len(recordings), 1)
+        self.assertEqual(len(readRecording(os.path.join(directory, recordings[0]))), 1)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())